@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+
+# @ Moritz Rempe, moritz.rempe@uk-essen.de
+# Institute for Artifical Intelligence in Medicine,
+# University Medicine Essen
+import re
+import string
+from datetime import datetime
+from functools import lru_cache
+
+
+_NUMBER_PATTERNS = {
+    "Patient_id": rb"(<ParamString.\"PatientID\">\s*\{\s*\")(.+)(\"\s*\}\n)",
+    "Device_serial": rb"(<ParamString.\"DeviceSerialNumber\">\s*\{\s*\")(.+)(\"\s*\}\n)",
+    "Exam_memory_uid": rb"(<ParamString.\"ExamMemoryUID\">\s*\{\s*\")(.+)(\"\s*\}\n)",
+    "PatientLOID": rb"(<ParamString.\"PatientLOID\">\s*\{\s*\")(.+)(\"\s*\}\n)",
+    "StudyLOID": rb"(<ParamString.\"StudyLOID\">\s*\{\s*\")(.+)(\"\s*\}\n)",
+    "SeriesLOID": rb"(<ParamString.\"SeriesLOID\">\s*\{\s*\")(.+)(\"\s*\}\n)",
+    "Study": rb"(<ParamString.\"Study\">\s*\{\s*\")(.+)(\"\s*\}\n)",
+    "FrameOfReference": rb"(<ParamString.\"FrameOfReference\">\s*\{\s*\")(.+)(\"\s*\}\n)",
+    "Patient": rb"(<ParamString.\"Patient\">\s*\{\s*\")(.+)(\"\s*\}\n)",
+    "MeasUID": rb"(<ParamString.\"MeasUID\">\s*\{\s*\")(.+)(\"\s*\}\n)",
+}
+
+_X_PATTERNS = {
+    "Patient_name": rb"(<ParamString.\"t?Patients?Name\">\s*\{(\s*<Visible>\s*\"true\"\s*)?\s*\")(.+)(\"\s*\}\n)",
+    "InstitutionAddress": rb"(<ParamString.\"InstitutionAddress\">\s*\{(\s*<Visible>\s*\"true\"\s*)?\s*\")(.+)(\"\s*\}\n)",
+    "InstitutionName": rb"(<ParamString.\"InstitutionName\">\s*\{(\s*<Visible>\s*\"true\"\s*)?\s*\")(.+)(\"\s*\}\n)",
+}
+
+_ZERO_PATTERNS = {
+    "Patient_gender": rb"(<ParamLong.\"l?PatientSex\">\s*\{(\s*<Visible>\s*\"true\"\s*)?\s*)(\d+)(\s*\}\n)",
+    "Patient_age": rb"(<ParamDouble.\"flPatientAge\">\s*\{(\s*<Visible>\s*\"true\"\s*)?\s*<Precision> \d+\s*)(\d+\.\d*)(\s*\}\n)",
+    "Patient_weight": rb"(<ParamDouble.\"flUsedPatientWeight\">\s*\{(\s*<Visible>\s*\"true\"\s*)?\s*<Precision> \d+\s*)(\d+\.\d*)(\s*\}\n)",
+    "Patient_height": rb"(<ParamDouble.\"flPatientHeight\">\s*\{(\s*<Visible>\s*\"true\"\s*)?\s*<Unit> \"\[mm\]\"\s*<Precision> \d+\s*)(\d+\.\d*)(\s*\}\n)",
+    "Patient_birthday": rb"(<ParamString.\"PatientBirthDay\">\s*\{(\s*<Visible>\s*\"true\"\s*)?\s*\")(\d{8})(\"\s*\}\n)",
+    "ulVersion": rb"(<ParamLong.\"ulVersion\">\s*\{(\s*<Visible>\s*\"true\"\s*)?\s*)(\d+)(\s*\}\n)",
+}
+
+_META_PATTERNS = {
+    "tBodyPartExamined": rb"(<ParamString.\"tBodyPartExamined\">\s*\{\s*\")(.+)(\"\s*\}\n)",
+    "Sequence": rb"(<ParamString.\"SequenceDescription\">\s*\{\s*\")(.+)(\"\s*\}\n)",
+    "TurboFactor": rb"(<ParamLong.\"TurboFactor\">\s*\{\s*)(\d+)(\s*\}\n)",
+    "ReadoutOversamplingFactor": rb"(<ParamDouble.\"ReadoutOversamplingFactor\">\s*\{\s*<Precision> \d+\s*)(\d+\.\d*)(\s*\}\n)",
+    "NSlc": rb"(<ParamLong.\"NSlc\">\s*\{\s*)(\d+)(\s*\}\n)",
+    "PhaseEncodingLines": rb"(<ParamLong.\"PhaseEncodingLines\">\s*\{\s*)(\d+)(\s*\}\n)",
+    "ReadFoV": rb"(<ParamDouble.\"ReadFoV\">\s*\{\s*<Precision> \d+\s*)(\d+\.\d*)(\s*\}\n)",
+    "PhaseFoV": rb"(<ParamDouble.\"PhaseFoV\">\s*\{\s*<Precision> \d+\s*)(\d+\.\d*)(\s*\}\n)",
+    "PhaseResolution": rb"(<ParamDouble.\"PhaseResolution\">\s*\{\s*<Precision> \d+\s*)(\d+\.\d*)(\s*\}\n)",
+    "TR": rb"(<ParamDouble.\"TR\">\s*\{\s*<Precision> \d+\s*)(\d+\.\d*)(\s*\}\n)",
+    "TI": rb"(<ParamDouble.\"TI\">\s*\{\s*<Precision> \d+\s*)(\d+\.\d*)(\s*\}\n)",
+    "flMagneticFieldStrength": rb"(<ParamDouble.\"flMagneticFieldStrength\">\s*\{\s*<Precision> \d+\s*)(\d+\.\d*)(\s*\}\n)",
+    "PatientPosition": rb"(<ParamString.\"PatientPosition\">\s*\{\s*\")(.+)(\"\s*\}\n)",
+}
+
+# All buffers are merged into one alternation, so the header is scanned only once. Each buffer is wrapped
+# in a group named after its key, the value to anonymize (or save) sits at a fixed offset from that group.
+# The "<Param" every buffer starts with is pulled in front of the alternation, so the engine can skip
+# ahead to the next literal "<Param" instead of trying every branch at every byte.
+_BUFFERS = {
+    "number": (_NUMBER_PATTERNS, 2),
+    "zero": (_ZERO_PATTERNS, 3),
+    "x": (_X_PATTERNS, 3),
+    "meta": (_META_PATTERNS, 2),
+}
+_PREFIX = b"<Param"
+assert all(
+    pattern.startswith(b"(" + _PREFIX)
+    for patterns, _ in _BUFFERS.values()
+    for pattern in patterns.values()
+)
+# A lookahead on just the parameter names rejects all other parameters before the full buffers are tried
+_NAMES = b"|".join(
+    re.match(rb"\(<Param(.*?\\\">)", pattern).group(1)
+    for patterns, _ in _BUFFERS.values()
+    for pattern in patterns.values()
+)
+_COMBINED_RE = re.compile(
+    _PREFIX
+    + b"(?="
+    + _NAMES
+    + b")(?:"
+    + b"|".join(
+        b"(?P<%s>(%s)" % (key.encode(), pattern[len(_PREFIX) + 1 :])
+        for patterns, _ in _BUFFERS.values()
+        for key, pattern in patterns.items()
+    )
+    + b")"
+)
+_VALUE_GROUPS = {
+    key: (mode, _COMBINED_RE.groupindex[key] + value_group)
+    for mode, (patterns, value_group) in _BUFFERS.items()
+    for key in patterns
+}
+
+# The keys of all values saved from the header, in the order of the buffers
+MATCH_KEYS = ["Exam_date", *_VALUE_GROUPS]
+
+# Translation tables replacing digits with 0, and word characters (as matched by \w) with x
+_DIGIT_TABLE = bytes.maketrans(string.digits.encode(), b"0" * len(string.digits))
+_WORD_CHARS = (string.ascii_letters + string.digits + "_").encode()
+_WORD_TO_X = bytes.maketrans(_WORD_CHARS, b"x" * len(_WORD_CHARS))
+
+
+# Files of the same day share their exam date, so the parsed dates are cached
+@lru_cache(maxsize=4096)
+def get_date(date_str: str) -> str:
+    """
+    Converts a date string in the format "%d%m%y" to the format "%y%m%d".
+
+    Args:
+        date_str (str): The date string to be converted.
+
+    Returns:
+        str: The converted date string in the format "%Y-%m-%d".
+    """
+    # Parse the string into a datetime object
+    date_obj = datetime.strptime(date_str, "%y%m%d")
+
+    # Format the datetime object into the desired format
+    formatted_date = date_obj.strftime("%Y-%m-%d")
+
+    return formatted_date
+
+
+def anonymize_header(header: bytes) -> tuple:
+    """
+    Anonymizes the header of a TWIX file by replacing sensitive information with placeholders.
+
+    The header is kept as bytes throughout, as all patterns are ASCII. Only the matched values are decoded.
+
+    Args:
+        header (bytes): The latin-1 encoded header of the TWIX file.
+
+    Returns:
+        tuple: A tuple containing the anonymized header and a dictionary of the matched values.
+
+    Credit:
+        This function was partially adapted from the original implementation by the authors of https://github.com/openmrslab/suspect/blob/master/suspect/io/twix.py
+    """
+    matches = {}
+
+    # All placeholders have the length of the value they replace, so they are written in place
+    anonymized = bytearray(header)
+    for match in _COMBINED_RE.finditer(header):
+        key = match.lastgroup
+        mode, group = _VALUE_GROUPS[key]
+
+        # Only the first value of every key is saved, later ones are not copied out of the header
+        if key not in matches:
+            matches[key] = match.group(group).decode("latin-1")
+
+        # Do not anonymize the meta buffers, but save them
+        if mode == "meta":
+            continue
+
+        start, end = match.span(group)
+        if mode == "number":
+            anonymized[start:end] = b"0" * (end - start)
+        elif mode == "zero":
+            anonymized[start:end] = header[start:end].translate(_DIGIT_TABLE)
+        else:
+            anonymized[start:end] = b"x" * (end - start)
+
+    missing = [key for key in ("FrameOfReference", *_X_PATTERNS) if key not in matches]
+    if missing:
+        raise ValueError(f"Could not find {', '.join(missing)} in the header.")
+
+    # The exam date is taken from the FrameOfReference found in the same pass
+    exam_date_time = matches["FrameOfReference"].split(".")[10]
+    exam_date = exam_date_time[2:8]
+    matches = {"Exam_date": get_date(exam_date), **matches}
+
+    exam_date_buffer = re.compile(
+        rb"\"[\d\.]*" + re.escape(exam_date.encode("latin-1")) + rb"[\d\.]*\""
+    )
+    # the spans are collected first, as the bytearray must not change while it is scanned
+    spans = [match.span() for match in exam_date_buffer.finditer(anonymized)]
+    for start, end in spans:
+        anonymized[start:end] = anonymized[start:end].translate(_WORD_TO_X)
+
+    return bytes(anonymized), matches
@@ -5,19 +5,27 @@
 # @ Moritz Rempe, moritz.rempe@uk-essen.de
 # Institute for Artifical Intelligence in Medicine,
 # University Medicine Essen
-import re
 import struct
-import random
+import secrets
 from pathlib import Path
 import logging
-from typing import IO
+import mmap
+from typing import IO, Callable, Iterable, Iterator
 from tqdm import tqdm
-from glob import glob
-import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from contextlib import nullcontext
 import argparse
+import csv
 import shutil
 import os
-from datetime import datetime
+import sys
+
+try:
+    from ._header import MATCH_KEYS, anonymize_header
+except ImportError:
+    # anonymize.py is run as a script from inside the package directory
+    from _header import MATCH_KEYS, anonymize_header
 
 logging.basicConfig(
     encoding="utf-8", level=logging.DEBUG, format="%(levelname)s - %(message)s"
@@ -51,6 +59,111 @@ parser.add_argument(
 )
 
 
+# Copying the raw data with sendfile keeps it in the kernel, only Linux supports it for regular files
+_USE_SENDFILE = hasattr(os, "sendfile") and sys.platform.startswith("linux")
+_COPY_CHUNK_SIZE = 1 << 22
+
+# TWIX files are little endian: the first two uints, a VD measurement descriptor and a header size
+_HDR = struct.Struct("<II")
+_DESC = struct.Struct("<IIQQ64s64s")
+_U32 = struct.Struct("<I")
+
+# Every CSV gets the same columns, so rows can be appended without reading the file back in
+_CSV_FIELDS = ["anonymized_id", "orig_filename", *MATCH_KEYS]
+
+
+def _check_csv(csv_path: str) -> None:
+    """
+    Checks that an existing CSV file has the columns rows are appended with.
+
+    Args:
+        csv_path (str): The path to the CSV file.
+
+    Raises:
+        ValueError: If the CSV file exists, but its column names differ, e.g. because it was written by an older version.
+
+    Returns:
+        None
+    """
+    if not Path(csv_path).is_file():
+        return
+    with open(csv_path, newline="", encoding="utf-8") as csv_file:
+        columns = next(csv.reader(csv_file), None)
+    if columns is not None and columns != _CSV_FIELDS:
+        raise ValueError(
+            f"{csv_path} has different columns than this version writes. "
+            "Move it out of the way or choose another output path."
+        )
+
+
+def _csv_writer(csv_file: IO) -> csv.DictWriter:
+    """
+    Creates a writer for rows of matches. The column names are only written if the file is empty, and
+    flushed right away, so forked worker processes do not inherit them in the buffer.
+
+    Args:
+        csv_file (file): The CSV file object, opened for writing or appending.
+
+    Returns:
+        csv.DictWriter: The writer for the rows of matches.
+    """
+    writer = csv.DictWriter(csv_file, fieldnames=_CSV_FIELDS)
+    if csv_file.tell() == 0:
+        writer.writeheader()
+        csv_file.flush()
+    return writer
+
+
+def _prefetch(fin: IO, offset: int, count: int) -> None:
+    """
+    Asks the kernel to start reading a range of the input file in the background, where supported.
+
+    Args:
+        fin (file): The input file object.
+        offset (int): The position in the input file the range starts at.
+        count (int): The number of bytes in the range, 0 for the rest of the file.
+
+    Returns:
+        None
+    """
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(fin.fileno(), offset, count, os.POSIX_FADV_WILLNEED)
+
+
+def _copy_range(fin: IO, fout: IO, offset: int, count: int) -> None:
+    """
+    Copies a range of the input file to the current position of the output file, without reading it into memory.
+
+    Args:
+        fin (file): The input file object.
+        fout (file): The output file object.
+        offset (int): The position in the input file to start copying from.
+        count (int): The number of bytes to copy.
+
+    Returns:
+        None
+    """
+    fout.flush()
+    position = fout.tell()
+    if _USE_SENDFILE:
+        copied = 0
+        while copied < count:
+            sent = os.sendfile(fout.fileno(), fin.fileno(), offset + copied, count - copied)
+            if sent == 0:
+                break
+            copied += sent
+        # sendfile moved the file descriptor, resync the buffered writer
+        fout.seek(position + copied)
+    else:
+        fin.seek(offset)
+        while count > 0:
+            chunk = fin.read(min(count, _COPY_CHUNK_SIZE))
+            if not chunk:
+                break
+            fout.write(chunk)
+            count -= len(chunk)
+
+
 class TwixAnonymizer:
     def __init__(
         self,
@@ -88,46 +201,67 @@ class TwixAnonymizer:
         self.csv_path = csv_path
         self.meta_only = meta_only
 
-    def read_and_anonymize(self) -> None:
+    def read_and_anonymize(self) -> dict | None:
         """
         Reads the file, determines its type, and performs anonymization based on the file type.
 
         This method reads the file specified by `self.filename` and determines its type by checking the first two uints in the header.
         Based on the file type, it performs anonymization using the appropriate method (`anonymize_twix_vd` or `anonymize_twix_vb`).
         The anonymized data is then written to a new file in the `self.save_path` directory.
-        If `self.meta_only` is True, only the metadata is anonymized and the anonymized data file is deleted.
+        If `self.meta_only` is True, only the metadata is anonymized and no anonymized data file is written.
+        The matches are written to `self.csv_path`, if one is given.
 
         Returns:
-            None
+            dict | None: The matches of the file, or None if the file could not be anonymized.
         """
         try: 
             with open(self.filename, "rb") as fin:
+                if hasattr(os, "posix_fadvise"):
+                    # the file is read front to back, so the kernel can use a larger readahead window
+                    os.posix_fadvise(fin.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
                 # we can tell the type of file from the first two uints in the header
-                first_uint, second_uint = struct.unpack("II", fin.read(8))
+                first_uint, second_uint = _HDR.unpack(fin.read(_HDR.size))
 
                 # reset the file pointer before giving to specific function
                 fin.seek(0)
 
-                with open(
-                    Path(self.save_path, f"{str(random.randint(0, 10000))}.dat"), "wb"
+                # a random id cannot be recomputed from the source path, existing files are never overwritten
+                while True:
+                    anonymized_id = secrets.token_hex(8)
+                    anonymized_filename = Path(self.save_path, f"{anonymized_id}.dat")
+                    if not anonymized_filename.exists():
+                        break
+
+                # headers and descriptors are written through a large buffer, the raw data bypasses it.
+                # If only the metadata is saved, no output file is opened at all.
+                with (
+                    open(anonymized_filename, "wb", buffering=_COPY_CHUNK_SIZE)
+                    if not self.meta_only
+                    else nullcontext()
                 ) as fout:
                     if first_uint == 0 and second_uint <= 64:
-                        self.filename, self.matches = self.anonymize_twix_vd(
+                        self.matches = self.anonymize_twix_vd(
                             fin, fout, meta_only=self.meta_only
                         )
                     else:
-                        self.filename, self.matches = self.anonymize_twix_vb(
+                        self.matches = self.anonymize_twix_vb(
                             fin, fout, meta_only=self.meta_only
                         )
+                    self.filename = str(anonymized_filename)
 
-                    self.write_csv()
-
-                fout.close()
+                    self.matches = {
+                        "anonymized_id": anonymized_id,
+                        "orig_filename": self.original_filename,
+                        **self.matches,
+                    }
+                    if self.csv_path is not None:
+                        self.write_csv()
 
-                if self.meta_only:
-                    os.remove(fout.name)
+            return self.matches
         except Exception as e:
             logging.warning(f"An error occurred while anonymizing {self.filename}:\n{e}.\n Continue with the next file.")
+            return None
 
     def write_csv(self) -> None:
         """
@@ -135,268 +269,200 @@ class TwixAnonymizer:
 
         This method takes the matches stored in the `self.matches` attribute and writes them to a CSV file.
         If a `csv_path` is provided, the matches are appended to an existing CSV file or a new file is created.
+        An existing CSV file with different columns is not appended to, but raises a ValueError.
         If no `csv_path` is provided, the matches are written to a new CSV file with the same name as the input file.
 
         Returns:
             None
         """
-
-        anonymized_id = Path(self.filename).stem
-        self.matches = {
-            "anonymized_id": anonymized_id,
-            "orig_filename": self.original_filename,
-            **self.matches,
-        }
         if self.csv_path:
-            self.filename = self.csv_path
-            if Path(self.filename).is_file():
-                df = pd.DataFrame(self.matches, index=[0])
-                df_orig = pd.read_csv(self.csv_path, index_col=0)
-                df = pd.concat([df_orig, df], ignore_index=True)
-                df.to_csv(self.filename, mode="w")
-            else:
-                df = pd.DataFrame(self.matches, index=[0])
-                df.to_csv(self.filename, mode="w")
+            _check_csv(self.csv_path)
+            with open(self.csv_path, "a", newline="", encoding="utf-8") as csv_file:
+                _csv_writer(csv_file).writerow(self.matches)
         else:
-            df = pd.DataFrame(self.matches, index=[0])
-            df.to_csv(self.filename, mode="w")
+            with open(self.filename, "w", newline="", encoding="utf-8") as csv_file:
+                _csv_writer(csv_file).writerow(self.matches)
 
     @staticmethod
-    def _get_date(date_str: str) -> str:
-        """
-        Converts a date string in the format "%d%m%y" to the format "%y%m%d".
-
-        Args:
-            date_str (str): The date string to be converted.
-
-        Returns:
-            str: The converted date string in the format "%Y-%m-%d".
+    def anonymize_twix_header(header: bytes) -> bytes | dict:
         """
-        # Parse the string into a datetime object
-        date_obj = datetime.strptime(date_str, "%y%m%d")
+        Anonymizes the header of a TWIX file by replacing sensitive information with placeholders.
 
-        # Format the datetime object into the desired format
-        formatted_date = date_obj.strftime("%Y-%m-%d")
-
-        return formatted_date
-
-    @staticmethod
-    def anonymize_twix_header(header_string: str) -> str | dict:
-        """
-        Anonymizes the header string of a TWIX file by replacing sensitive information with placeholders.
+        Thin wrapper around `anonymize_header` of the `_header` module.
 
         Args:
-            header_string (str): The header string of the TWIX file.
+            header (bytes): The latin-1 encoded header of the TWIX file.
 
         Returns:
-            tuple: A tuple containing the anonymized header string and a dictionary of the matched values.
-
-        Credit:
-            This method was partially adapted from the original implementation by the authors of https://github.com/openmrslab/suspect/blob/master/suspect/io/twix.py
+            tuple: A tuple containing the anonymized header and a dictionary of the matched values.
         """
-        number_buffer = {
-            "Patient_id": r"(<ParamString.\"PatientID\">\s*\{\s*\")(.+)(\"\s*\}\n)",
-            "Device_serial": r"(<ParamString.\"DeviceSerialNumber\">\s*\{\s*\")(.+)(\"\s*\}\n)",
-            "Exam_memory_uid": r"(<ParamString.\"ExamMemoryUID\">\s*\{\s*\")(.+)(\"\s*\}\n)",
-            "PatientLOID": r"(<ParamString.\"PatientLOID\">\s*\{\s*\")(.+)(\"\s*\}\n)",
-            "StudyLOID": r"(<ParamString.\"StudyLOID\">\s*\{\s*\")(.+)(\"\s*\}\n)",
-            "SeriesLOID": r"(<ParamString.\"SeriesLOID\">\s*\{\s*\")(.+)(\"\s*\}\n)",
-            "Study": r"(<ParamString.\"Study\">\s*\{\s*\")(.+)(\"\s*\}\n)",
-            "FrameOfReference": r"(<ParamString.\"FrameOfReference\">\s*\{\s*\")(.+)(\"\s*\}\n)",
-            "Patient": r"(<ParamString.\"Patient\">\s*\{\s*\")(.+)(\"\s*\}\n)",
-            "MeasUID": r"(<ParamString.\"MeasUID\">\s*\{\s*\")(.+)(\"\s*\}\n)",
-        }
-        x_buffer = {
-            "Patient_name": r"(<ParamString.\"t?Patients?Name\">\s*\{(\s*<Visible>\s*\"true\"\s*)?\s*\")(.+)(\"\s*\}\n)",
-            "InstitutionAddress": r"(<ParamString.\"InstitutionAddress\">\s*\{(\s*<Visible>\s*\"true\"\s*)?\s*\")(.+)(\"\s*\}\n)",
-            "InstitutionName": r"(<ParamString.\"InstitutionName\">\s*\{(\s*<Visible>\s*\"true\"\s*)?\s*\")(.+)(\"\s*\}\n)",
-        }
-        zero_buffer = {
-            "Patient_gender": r"(<ParamLong.\"l?PatientSex\">\s*\{(\s*<Visible>\s*\"true\"\s*)?\s*)(\d+)(\s*\}\n)",
-            "Patient_age": r"(<ParamDouble.\"flPatientAge\">\s*\{(\s*<Visible>\s*\"true\"\s*)?\s*<Precision> \d+\s*)(\d+\.\d*)(\s*\}\n)",
-            "Patient_weight": r"(<ParamDouble.\"flUsedPatientWeight\">\s*\{(\s*<Visible>\s*\"true\"\s*)?\s*<Precision> \d+\s*)(\d+\.\d*)(\s*\}\n)",
-            "Patient_height": r"(<ParamDouble.\"flPatientHeight\">\s*\{(\s*<Visible>\s*\"true\"\s*)?\s*<Unit> \"\[mm\]\"\s*<Precision> \d+\s*)(\d+\.\d*)(\s*\}\n)",
-            "Patient_birthday": r"(<ParamString.\"PatientBirthDay\">\s*\{(\s*<Visible>\s*\"true\"\s*)?\s*\")(\d{8})(\"\s*\}\n)",
-            "ulVersion": r"(<ParamLong.\"ulVersion\">\s*\{(\s*<Visible>\s*\"true\"\s*)?\s*)(\d+)(\s*\}\n)",
-        }
-        meta_buffer = {
-            "tBodyPartExamined": r"(<ParamString.\"tBodyPartExamined\">\s*\{\s*\")(.+)(\"\s*\}\n)",
-            "Sequence": r"(<ParamString.\"SequenceDescription\">\s*\{\s*\")(.+)(\"\s*\}\n)",
-            "TurboFactor": r"(<ParamLong.\"TurboFactor\">\s*\{\s*)(\d+)(\s*\}\n)",
-            "ReadoutOversamplingFactor": r"(<ParamDouble.\"ReadoutOversamplingFactor\">\s*\{\s*<Precision> \d+\s*)(\d+\.\d*)(\s*\}\n)",
-            "NSlc": r"(<ParamLong.\"NSlc\">\s*\{\s*)(\d+)(\s*\}\n)",
-            "PhaseEncodingLines": r"(<ParamLong.\"PhaseEncodingLines\">\s*\{\s*)(\d+)(\s*\}\n)",
-            "ReadFoV": r"(<ParamDouble.\"ReadFoV\">\s*\{\s*<Precision> \d+\s*)(\d+\.\d*)(\s*\}\n)",
-            "PhaseFoV": r"(<ParamDouble.\"PhaseFoV\">\s*\{\s*<Precision> \d+\s*)(\d+\.\d*)(\s*\}\n)",
-            "PhaseResolution": r"(<ParamDouble.\"PhaseResolution\">\s*\{\s*<Precision> \d+\s*)(\d+\.\d*)(\s*\}\n)",
-            "TR": r"(<ParamDouble.\"TR\">\s*\{\s*<Precision> \d+\s*)(\d+\.\d*)(\s*\}\n)",
-            "TI": r"(<ParamDouble.\"TI\">\s*\{\s*<Precision> \d+\s*)(\d+\.\d*)(\s*\}\n)",
-            "flMagneticFieldStrength": r"(<ParamDouble.\"flMagneticFieldStrength\">\s*\{\s*<Precision> \d+\s*)(\d+\.\d*)(\s*\}\n)",
-            "PatientPosition": r"(<ParamString.\"PatientPosition\">\s*\{\s*\")(.+)(\"\s*\}\n)",
-        }
-
-        matches = {}
-
-        frame_of_reference = re.search(
-            r"(<ParamString.\"FrameOfReference\">  { )(\".+\")(  }\n)", header_string
-        ).group(2)
-        exam_date_time = frame_of_reference.split(".")[10]
-        exam_date = exam_date_time[2:8]
-        matches["Exam_date"] = TwixAnonymizer._get_date(exam_date)
-
-        for key, buffer in number_buffer.items():
-            match = re.search(buffer, header_string)
-            if match:
-                matches[key] = match.group(2)
-                header_string = re.sub(
-                    buffer,
-                    lambda match: "".join(
-                        (match.group(1), ("0" * (len(match.group(2)))), match.group(3))
-                    ),
-                    header_string,
-                )
-
-        for key, buffer in zero_buffer.items():
-            match = re.search(buffer, header_string)
-            if match:
-                matches[key] = match.group(3)
-                header_string = re.sub(
-                    buffer,
-                    lambda match: "".join(
-                        (
-                            match.group(1),
-                            re.sub(r"\d", "0", match.group(3)),
-                            match.group(4),
-                        )
-                    ),
-                    header_string,
-                )
-
-        for key, buffer in x_buffer.items():
-            match = re.search(buffer, header_string)
-            matches[key] = match.group(3)
-            header_string = re.sub(
-                buffer,
-                lambda match: "".join(
-                    (
-                        match.group(1),
-                        ("x" * (len(match.group(3)))),
-                        match.group(4),
-                    )
-                ),
-                header_string,
-            )
-
-        # Do not anonymize these buffers, but save them
-        for key, buffer in meta_buffer.items():
-            match = re.search(buffer, header_string)
-            if match:
-                matches[key] = match.group(2)
-
-        header_string = re.sub(
-            r"\"[\d\.]*{0}[\d\.]*\"".format(exam_date),
-            lambda match: re.sub(r"\w", "x", match.group()),
-            header_string,
-        )
-
-        return header_string, matches
+        return anonymize_header(header)
 
     @staticmethod
-    def anonymize_twix_vd(fin: IO, fout: IO, meta_only: bool = False) -> str | dict:
+    def anonymize_twix_vd(fin: IO, fout: IO | None, meta_only: bool = False) -> dict:
         """
         Anonymizes a TWIX VD file.
 
         Args:
             fin (file): The input file object.
-            fout (file): The output file object.
+            fout (file | None): The output file object, None if only the metadata is saved.
             meta_only (bool, optional): If True, only save the metadata, but do not write anonymized file. Defaults to False.
 
         Returns:
-            Union[str, dict]: The name of the output file and a dictionary of matches found during anonymization.
+            dict: A dictionary of matches found during anonymization.
 
         Credit:
             This method was adapted from the original implementation by the authors of https://github.com/openmrslab/suspect/blob/master/suspect/io/twix.py
         """
-        twix_id, num_measurements = struct.unpack("II", fin.read(8))
+        # the descriptors and headers are unpacked straight from a read-only mapping of the file
+        with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            twix_id, num_measurements = _HDR.unpack_from(data, 0)
 
-        if not meta_only:
-            fout.write(struct.pack("II", twix_id, num_measurements))
+            if not meta_only:
+                fout.write(_HDR.pack(twix_id, num_measurements))
 
-        for i in range(num_measurements):
-            fin.seek(8 + 152 * i)
-            meas_id, file_id, offset, length, patient_name, protocol_name = (
-                struct.unpack("IIQQ64s64s", fin.read(152))
-            )
-            anon_patient_name = ("x" * 64).encode("latin-1")
+            for i in range(num_measurements):
+                meas_id, file_id, offset, length, patient_name, protocol_name = (
+                    _DESC.unpack_from(data, _HDR.size + _DESC.size * i)
+                )
+                anon_patient_name = ("x" * 64).encode("latin-1")
 
-            fin.seek(offset)
-            # read the header and anonymize it
-            header_size = struct.unpack("I", fin.read(4))[0]
-            header = fin.read(header_size - 4)
-            header_string = header[:-24].decode("latin-1")
+                # read the header and anonymize it
+                header_size = _U32.unpack_from(data, offset)[0]
+                header = data[offset + _U32.size : offset + header_size]
 
-            anonymized_header, matches = TwixAnonymizer.anonymize_twix_header(
-                header_string=header_string
-            )
+                # the raw data is read from disk while the header is anonymized
+                if not meta_only:
+                    _prefetch(fin, offset + header_size, length - header_size)
 
-            if not meta_only:
-                fout.seek(8 + 152 * i)
-                fout.write(
-                    struct.pack(
-                        "IIQQ64s64s",
-                        meas_id,
-                        file_id,
-                        offset,
-                        length,
-                        anon_patient_name,
-                        protocol_name,
-                    )
+                anonymized_header, matches = TwixAnonymizer.anonymize_twix_header(
+                    header=header[:-24]
                 )
 
-                fout.seek(offset)
-                fout.write(struct.pack("I", header_size))
-                fout.write(anonymized_header.encode("latin1"))
-                fout.write(header[-24:])
-                fout.write(fin.read(length - header_size))
+                if not meta_only:
+                    fout.seek(_HDR.size + _DESC.size * i)
+                    fout.write(
+                        _DESC.pack(
+                            meas_id,
+                            file_id,
+                            offset,
+                            length,
+                            anon_patient_name,
+                            protocol_name,
+                        )
+                    )
 
-        return fout.name, matches
+                    fout.seek(offset)
+                    fout.write(_U32.pack(header_size))
+                    fout.write(anonymized_header)
+                    fout.write(header[-24:])
+                    _copy_range(fin, fout, offset + header_size, length - header_size)
+
+        return matches
 
     @staticmethod
-    def anonymize_twix_vb(fin: IO, fout: IO, meta_only: bool = False) -> str | dict:
+    def anonymize_twix_vb(fin: IO, fout: IO | None, meta_only: bool = False) -> dict:
         """
         Anonymizes a TWIX VB file.
 
         Args:
             fin (file): The input file object.
-            fout (file): The output file object.
+            fout (file | None): The output file object, None if only the metadata is saved.
             meta_only (bool, optional): If True, only save the metadata, but do not write anonymized file. Defaults to False.
 
         Returns:
-            Union[str, dict]: The name of the output file and a dictionary of matches found during anonymization.
+            dict: A dictionary of matches found during anonymization.
 
         Credit:
             This method was adapted from the original implementation by the authors of https://github.com/openmrslab/suspect/blob/master/suspect/io/twix.py
         """
+        with mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            # first four bytes are the size of the header
+            header_size = _U32.unpack_from(data, 0)[0]
 
-        # first four bytes are the size of the header
-        header_size = struct.unpack("I", fin.read(4))[0]
+            # the rest of the header minus the four bytes we already read
+            header = data[_U32.size : header_size]
+            file_size = len(data)
 
-        # read the rest of the header minus the four bytes we already read
-        header = fin.read(header_size - 4)
-        # last 24 bytes of the header contain non-strings
-        header_string = header[:-24].decode("latin-1")
+        # the raw data is read from disk while the header is anonymized
+        if not meta_only:
+            _prefetch(fin, header_size, 0)
 
+        # last 24 bytes of the header contain non-strings
         anonymized_header, matches = TwixAnonymizer.anonymize_twix_header(
-            header_string=header_string
+            header=header[:-24]
         )
 
         if not meta_only:
-            fout.write(struct.pack("I", header_size))
-            fout.write(anonymized_header.encode("latin-1"))
+            fout.write(_U32.pack(header_size))
+            fout.write(anonymized_header)
             fout.write(header[-24:])
-            fout.write(fin.read())
+            _copy_range(fin, fout, header_size, file_size - header_size)
+
+        return matches
+
+
+def _iter_twix_files(directory: str) -> Iterator[str]:
+    """
+    Lazily yields the paths of all TWIX files in a directory, so no list of all paths is held in memory.
 
-        return fout.name, matches
+    Args:
+        directory (str): The directory containing the TWIX files.
+
+    Yields:
+        str: The path of a TWIX file.
+    """
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            # hidden files are skipped, as glob did before
+            if (
+                entry.name.endswith(".dat")
+                and not entry.name.startswith(".")
+                and entry.is_file()
+            ):
+                yield entry.path
+
+
+def process_file(filename: str, save_path: str, meta_only: bool = False) -> dict | None:
+    """
+    Anonymizes a single TWIX file. Defined at module level, so it can be sent to worker processes.
+
+    Args:
+        filename (str): The path to the TWIX file to be anonymized.
+        save_path (str): The directory where the anonymized TWIX file will be saved.
+        meta_only (bool, optional): If True, only save the metadata, but do not write anonymized file. Defaults to False.
+
+    Returns:
+        dict | None: The matches of the file, or None if the file could not be anonymized.
+    """
+    anonymizer = TwixAnonymizer(filename, save_path, meta_only=meta_only)
+    return anonymizer.read_and_anonymize()
+
+
+def _map_bounded(
+    executor: ProcessPoolExecutor, fn: Callable, iterable: Iterable, window: int, *args
+) -> Iterator:
+    """
+    Like executor.map, but only submits the next item once fewer than window items are in flight,
+    so the iterable is consumed lazily and only window futures are held at a time.
+
+    Args:
+        executor (ProcessPoolExecutor): The executor to submit the items to.
+        fn (Callable): The function called with every item, followed by args.
+        iterable (Iterable): The items to process.
+        window (int): The maximum number of items in flight.
+        *args: Further arguments passed to fn for every item.
+
+    Yields:
+        The results of fn, in the order of the items.
+    """
+    futures = deque()
+    for item in iterable:
+        if len(futures) >= window:
+            yield futures.popleft().result()
+        futures.append(executor.submit(fn, item, *args))
+    while futures:
+        yield futures.popleft().result()
 
 
 def anonymize_twix(input_path: str, save_path: str, meta_only: bool = False):
@@ -414,8 +480,8 @@ def anonymize_twix(input_path: str, save_path: str, meta_only: bool = False):
     """
 
     if Path(input_path).is_dir():
-        files = [path for path in glob(f"{input_path}/*.dat")]
-        folder_len = len(files)
+        # Only the files are counted here, so the progress bar has a total without holding all paths
+        folder_len = sum(1 for _ in _iter_twix_files(input_path))
         if meta_only:
             logging.info(f"Only saving metadata! Not writing anonymized files.")
         else:
@@ -424,16 +490,32 @@ def anonymize_twix(input_path: str, save_path: str, meta_only: bool = False):
         logging.info(f"Total of {folder_len} files.")
 
         csv_path = Path(save_path, f"{Path(input_path).name}.csv")
-
-        for filename in tqdm(
-            files, desc="Anonymizing files", total=folder_len, unit="files"
-        ):
-            anonymizer = TwixAnonymizer(filename, save_path, csv_path, meta_only)
-            anonymizer.read_and_anonymize()
+        _check_csv(csv_path)
+
+        # Files are anonymized in parallel, only this process writes their matches to the CSV.
+        # A few files per worker are kept in flight, so workers never wait for the next file.
+        max_workers = os.cpu_count() or 1
+        with open(csv_path, "a", newline="", encoding="utf-8") as csv_file:
+            writer = _csv_writer(csv_file)
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                results = _map_bounded(
+                    executor,
+                    process_file,
+                    _iter_twix_files(input_path),
+                    4 * max_workers,
+                    save_path,
+                    meta_only,
+                )
+                for matches in tqdm(
+                    results, desc="Anonymizing files", total=folder_len, unit="files"
+                ):
+                    if matches is not None:
+                        writer.writerow(matches)
 
     else:
         logging.info(f"Anonymizing {input_path}.")
         csv_path = Path(save_path, f"{Path(input_path).stem}.csv")
+        _check_csv(csv_path)
         if meta_only:
             logging.info(f"Only saving metadata! Not writing anonymized files.")
         anonymizer = TwixAnonymizer(input_path, save_path, csv_path, meta_only)